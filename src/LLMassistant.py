@@ -4,44 +4,193 @@
 # --------------------------------------------------
 # Responsibilities:
 #   1. Parse user text (items + constraints)
-#   2. Map items → store nodes
-#   3. Use LLM reasoning to build a route plan
+#   2. Map items → store nodes (same LLM call as step 1)
+#   3. Order the route (local TSP solver, or LLM reasoning)
 #   4. Execute via pathFinder
 #   5. Summarize results
 # --------------------------------------------------
 
 import json
-from openai import OpenAI
+import asyncio
+import weakref
+from contextlib import suppress
+import httpx
+import orjson
+from openai import AsyncOpenAI
 from pathlib import Path
-from dataExtract import extract_known_items, extract_graph_structure
-from storeGraph import build_store_graph, find_section_by_item
+from dataExtract import extract_graph_structure
+from storeGraph import get_cached_graph, compute_poi_apsp
 from pathFinder import execute_plan
+from planner import plan_route
+from semanticCache import SemanticCache
+
+# JSON mode guarantees bare JSON, so one shared decoder handles every response
+_JSON_DECODER = json.JSONDecoder()
+
+# One OpenAI client per event loop, shared by every assistant on that loop.
+# Pooled connections are bound to the loop that opened them, so a client
+# can't outlive or move between loops.
+_CLIENTS = weakref.WeakKeyDictionary()
+# Closes of stale clients still running; referenced so they finish
+_CLOSING = set()
+
+
+def _new_client():
+    """OpenAI client on a pooled HTTP/2 connection so concurrent calls multiplex."""
+    return AsyncOpenAI(
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            timeout=30.0
+        )
+    )
+
+
+def get_client():
+    """
+    Return the shared OpenAI client for the running event loop, opening it
+    on first use. Clients left behind by event loops that have since closed
+    are closed then, so their connection pools don't leak.
+    """
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        for stale_loop in [other for other in _CLIENTS if other.is_closed()]:
+            task = loop.create_task(_close_stale(_CLIENTS.pop(stale_loop)))
+            _CLOSING.add(task)
+            task.add_done_callback(_CLOSING.discard)
+        client = _CLIENTS[loop] = _new_client()
+    return client
+
+
+async def _close_stale(client):
+    """
+    Close a client whose event loop has closed. Its open connections can't
+    be shut down on a closed loop (RuntimeError); once the client is
+    dropped their sockets are released with it.
+    """
+    with suppress(RuntimeError):
+        await client.close()
+
+
+async def close_client():
+    """Close the running loop's shared client; the next call opens a new one."""
+    client = _CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
 
 
 class LLMAssistant:
-    def __init__(self, model="gpt-4o-mini", debug=False):
-        """Initialize model and load store graph."""
+    def __init__(self, json_path="data/storeMap.json", model="gpt-4o-mini", debug=False,
+                 planner="local", cache_path=None):
+        """
+        Initialize model and load store graph and prompt context from json_path.
+        planner="local" orders routes with the TSP solver in planner.py;
+        planner="llm" asks the model to plan them instead.
+        cache_path enables the persistent SemanticCache of plans.
+        """
+        if planner not in ("local", "llm"):
+            raise ValueError(f"Unknown planner: {planner!r}")
         self.model = model
         self.debug = debug
-        self.client = OpenAI()
-        self.G = build_store_graph()
+        self.planner = planner
+        self.json_path = json_path
+        self.G = get_cached_graph(json_path)
+
+        # Prompt context is built once so every call sends a byte-identical prefix
+        store_items_to_nodes = {
+            item: [node for node, _ in matches]
+            for item, matches in sorted(self.G.graph["item_index"].items())
+        }
+        self._store_items_json = orjson.dumps(store_items_to_nodes).decode()
+        self._graph_struct_str = None
+        if planner == "llm":
+            self._graph_struct_str = orjson.dumps(extract_graph_structure(json_path)).decode()
+        self.cache = None
+        if cache_path is not None:
+            json_file, mtime = self.G.graph["source"]
+            self.cache = SemanticCache(get_client, cache_path, f"{json_file}:{mtime}")
+
+    # --------------------------------------------------
+    async def aclose(self):
+        """
+        Close the running loop's shared connection pool; call before the
+        event loop ends. Other assistants on the loop reconnect on their
+        next call.
+        """
+        await close_client()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
 
     # --------------------------------------------------
-    def parse_user_input(self, user_text):
+    async def _stream_json(self, messages):
         """
-        Step 1: Extract items and constraints from natural language.
+        Stream a JSON-mode chat completion and return (decoded object, token
+        usage) as soon as it is complete. Usage is returned rather than kept
+        on the assistant, which concurrent sessions share.
+        """
+        stream = await get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0,
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        content = ""
+        parsed = None
+        usage = None
+        try:
+            async for chunk in stream:
+                # Usage arrives in a final chunk with no choices, right after the object closes
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if parsed is not None or not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                delta = chunk.choices[0].delta.content
+                content += delta
+                # Only a closing brace can complete the object, so only then try a decode
+                if "}" in delta:
+                    try:
+                        parsed, _ = _JSON_DECODER.raw_decode(content.lstrip())
+                    except json.JSONDecodeError:
+                        continue
+        finally:
+            await stream.close()
+
+        if parsed is None:
+            # Stream ended without a complete object; let decode() raise
+            parsed = _JSON_DECODER.decode(content)
+
+        if self.debug:
+            print("DEBUG: Model raw response:", repr(content))
+            details = getattr(usage, "prompt_tokens_details", None)
+            if details is not None:
+                print(f"DEBUG: Prompt tokens: {usage.prompt_tokens} (cached: {details.cached_tokens})")
+        return parsed, usage
+
+    # --------------------------------------------------
+    async def parse_user_input(self, user_text):
+        """
+        Steps 1+2: Extract items and constraints from natural language and
+        ground each item to its store node ID in the same LLM call.
         """
-        store_items = extract_known_items(json_path)
         messages = [
-            {"role": "system", "content": "You are an assistant that extracts structured data from shopping requests. Only include items that exist in the provided store list."},
+            {"role": "system", "content": "You are an assistant that extracts structured data from shopping requests and maps each requested item to the store node IDs that stock it. Only use node IDs from the provided mapping."},
             {
                 "role": "user",
                 "content": f"""
-        The store's valid item list is:
-        {json.dumps(store_items, indent=2)}
+        The store's valid items and the node IDs that stock them are:
+        {self._store_items_json}
 
         If a requested item is not in this list, replace it with the closest logical match from the list.
-        Now parse this user request into JSON with keys 'items' and 'constraints':
+        Now parse this user request into JSON with keys 'nodes' (one node ID per requested item)
+        and 'constraints' (use an 'avoid' list of node IDs for areas the shopper wants to skip):
 
         {user_text}
         """
@@ -49,22 +198,7 @@ class LLMAssistant:
         ]
 
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0
-        )
-
-        content = response.choices[0].message.content
-        print("DEBUG: Model raw response:", repr(content))
-        if content.startswith("```"):
-            content = content.strip("`")       # remove backticks
-            content = content.replace("json", "", 1).strip()  # remove optional 'json' language tag
-
-        if self.debug:
-            print("DEBUG: Cleaned model output:", repr(content))
-
-        parsed = json.loads(content)
+        parsed, _ = await self._stream_json(messages)
 
         if self.debug:
             print("Parsed input:", parsed)
@@ -72,31 +206,30 @@ class LLMAssistant:
         return parsed
 
     # --------------------------------------------------
-    def map_items_to_nodes(self, items):
+    async def generate_plan(self, mapped_nodes, constraints):
         """
-        Step 2: Map item names to node IDs in the store graph.
+        Step 3: Order the mapped nodes into a route plan, locally or via
+        the LLM depending on self.planner.
         """
-        mapped_nodes = []
-        for item in items:
-            matches = find_section_by_item(self.G, item)
-            if matches:
-                mapped_nodes.append(matches[0][0])  # use first matching node
+        if self.planner == "llm":
+            plan = await self._generate_llm_plan(mapped_nodes, constraints)
+        else:
+            # The exact solver and path expansion are CPU-bound; keep them off the loop
+            plan = await asyncio.to_thread(plan_route, mapped_nodes, constraints, self.json_path)
+
         if self.debug:
-            print("Mapped nodes:", mapped_nodes)
-        return mapped_nodes
+            print("Generated plan:", json.dumps(plan, indent=2))
+
+        return plan
 
     # --------------------------------------------------
-    def generate_plan(self, mapped_nodes, constraints):
-        """
-        Step 3: Use the LLM to create an ordered route plan.
-        """
+    async def _generate_llm_plan(self, mapped_nodes, constraints):
+        """Ask the LLM to order the mapped nodes into a route plan."""
         context = {
             "mapped_nodes": mapped_nodes,
             "constraints": constraints
         }
 
-        graph_struct = extract_graph_structure(json_path)
-
         system_prompt = """
         You are a navigation planner for a grocery store.
         Given a set of store node IDs to visit and constraints,
@@ -110,31 +243,36 @@ class LLMAssistant:
         Only return JSON — no explanations.
         """
 
+        # Static content first so the prompt prefix is identical across calls and
+        # the provider's prefix cache can reuse it; only the user message varies.
+        # (Anthropic would additionally need "cache_control": {"type": "ephemeral"}
+        # on the graph message.)
         messages = [
+            {"role": "system", "content": f"This graph provides the store node IDs with their sections, and edges as 'u-v:distance' lines. This is how you will determine the ideal route.: {self._graph_struct_str}"},
             {"role": "system", "content": system_prompt},
-            {"role": "system", "content": f"This graph provides the store node IDs, along with x and y coordinates, and edges with weights. This is how you will determine the ideal route.: {graph_struct}"},
-            {"role": "user", "content": json.dumps(context)}
+            {"role": "user", "content": orjson.dumps(context).decode()}
         ]
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0
-        )
-
-        plan = json.loads(response.choices[0].message.content)
-
-        if self.debug:
-            print("Generated plan:", json.dumps(plan, indent=2))
+        # Warm the base graph's path table in a worker thread while the plan
+        # streams in. An avoid list routes on a separate graph, so warming the
+        # base one would be wasted work.
+        warm_up = None
+        if not (constraints or {}).get("avoid"):
+            pois = [n for n in mapped_nodes if n in self.G]
+            loop = asyncio.get_running_loop()
+            warm_up = loop.run_in_executor(None, compute_poi_apsp, self.G, pois)
 
+        plan, _ = await self._stream_json(messages)
+        if warm_up is not None:
+            await warm_up
         return plan
 
     # --------------------------------------------------
-    def execute_plan(self, plan):
+    def execute_plan(self, plan, visualize=False):
         """
         Step 4: Pass the plan to pathFinder for execution.
         """
-        path, total_distance = execute_plan(plan)
+        path, total_distance = execute_plan(plan, visualize=visualize, json_path=self.json_path)
         if self.debug:
             print("Path executed:", path)
             print("Total distance:", total_distance)
@@ -151,21 +289,77 @@ class LLMAssistant:
         return summary
 
     # --------------------------------------------------
-    def run_session(self, user_text):
+    async def run_session(self, user_text):
         """
-        Complete pipeline: parse → map → plan → execute → summarize.
+        Complete pipeline: parse + map → plan → execute → summarize.
+        A cache hit skips straight from the user text to execution. The
+        cache is optional: if it fails, the session runs as on a miss.
         """
-        parsed = self.parse_user_input(user_text)
-        items = parsed["items"]
+        embedding = None
+        parse_task = None
+        if self.cache is not None:
+            plan = self.cache.lookup_exact(user_text)
+            if plan is None:
+                # Start parsing now so a miss doesn't also wait out the embedding
+                # round trip; the parse is cancelled if the similar lookup hits
+                parse_task = asyncio.ensure_future(self.parse_user_input(user_text))
+                try:
+                    plan, embedding = await self.cache.lookup_similar(user_text)
+                except Exception as exc:
+                    if self.debug:
+                        print("Cache lookup failed:", exc)
+                except BaseException:
+                    parse_task.cancel()
+                    raise
+                if plan is not None:
+                    parse_task.cancel()
+            if plan is not None:
+                if self.debug:
+                    print("Cache hit:", json.dumps(plan))
+                path, total_distance = self.execute_plan(plan)
+                return self.summarize_results(path, total_distance)
+
+        parsed = await (parse_task or self.parse_user_input(user_text))
         constraints = parsed.get("constraints", {})
 
-        mapped_nodes = self.map_items_to_nodes(items)
-        plan = self.generate_plan(mapped_nodes, constraints)
+        # The parse call already grounded items to nodes. The model may answer
+        # with a list of candidate IDs for an item, so take the first real one;
+        # keep only real node IDs, once each
+        mapped_nodes = []
+        for entry in parsed.get("nodes") or []:
+            if isinstance(entry, list):
+                entry = next((n for n in entry if isinstance(n, str) and n in self.G), None)
+            if isinstance(entry, str) and entry in self.G and entry not in mapped_nodes:
+                mapped_nodes.append(entry)
+        if self.debug:
+            print("Mapped nodes:", mapped_nodes)
+        plan = await self.generate_plan(mapped_nodes, constraints)
         path, total_distance = self.execute_plan(plan)
+        # Only plans that executed are cached, so a bad plan isn't replayed
+        if self.cache is not None:
+            try:
+                await self.cache.store(user_text, plan, embedding)
+            except Exception as exc:
+                if self.debug:
+                    print("Cache store failed:", exc)
         summary = self.summarize_results(path, total_distance)
 
         return summary
 
+    # --------------------------------------------------
+    async def run_sessions(self, user_texts, max_concurrency=4):
+        """
+        Batch mode: run several sessions concurrently, with at most
+        max_concurrency in flight. Summaries come back in input order.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def bounded(user_text):
+            async with semaphore:
+                return await self.run_session(user_text)
+
+        return await asyncio.gather(*(bounded(text) for text in user_texts))
+
 
 # --------------------------------------------------
 # Example Usage
@@ -173,7 +367,11 @@ class LLMAssistant:
 
 if __name__ == "__main__":
     json_path = Path(__file__).resolve().parent.parent / "data" /"storeMap.json"
-    assistant = LLMAssistant(debug=True)
     user_text = input("Enter grocery instructions: ")
-    result = assistant.run_session(user_text)
+
+    async def main():
+        async with LLMAssistant(json_path, debug=True) as assistant:
+            return await assistant.run_session(user_text)
+
+    result = asyncio.run(main())
     print("\nFinal Summary:\n", result)
\ No newline at end of file
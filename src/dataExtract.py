@@ -1,43 +1,63 @@
-import json
+import orjson
+from functools import lru_cache
 from pathlib import Path
 
+
+@lru_cache(maxsize=4)
+def _load_raw(path_str: str, mtime: float) -> dict:
+    """Parse storeMap.json; mtime is only part of the cache key."""
+    with open(path_str, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def load_store_map(json_path: str | Path) -> dict:
+    """
+    Return the parsed storeMap.json, re-reading it only when the file
+    has changed. The dict is shared between callers — do not mutate it.
+    """
+    path = Path(json_path).resolve()
+    return _load_raw(str(path), path.stat().st_mtime)
+
 def extract_known_items(json_path: str | Path) -> list[str]:
     """Collect unique item names from storeMap.json."""
-    with open(json_path, "r") as f:
-        data = json.load(f)
+    data = load_store_map(json_path)
 
-    items_set = set()
-    for node_id, node_data in data.get("nodes", {}).items():
-        for item in node_data.get("items", []):
-            items_set.add(item.lower().strip())
+    items_set = {
+        item.strip().casefold()
+        for node_data in data.get("nodes", {}).values()
+        for item in node_data.get("items", ())
+    }
 
     return sorted(items_set)
 
 def extract_graph_structure(json_path: str | Path) -> dict:
     """
     Extract only the essential structural data from storeMap.json
-    for LLM route planning:
-        - nodes: {id: {x, y, section}}
-        - edges: {id: {neighbor: distance}}
+    for LLM route planning, kept compact to save prompt tokens:
+        - nodes: {id: section}
+        - edges: "u-v:distance" lines, one per undirected edge
+    Coordinates are dropped; edge distances already encode them.
     Returns a plain Python dict ready for json.dumps().
     """
-    with open(json_path, "r") as f:
-        data = json.load(f)
+    data = load_store_map(json_path)
 
     # --- Nodes ---
     nodes = {
-        node_id: {
-            "x": node_data.get("x"),
-            "y": node_data.get("y"),
-            "section": node_data.get("section")
-        }
+        node_id: node_data.get("section")
         for node_id, node_data in data.get("nodes", {}).items()
     }
 
-    # --- Edges (already correct structure) ---
-    edges = data.get("edges", {})
+    # --- Edges (each undirected edge once) ---
+    seen = set()
+    edge_lines = []
+    for src, neighbors in data.get("edges", {}).items():
+        for dest, dist in neighbors.items():
+            if (dest, src) in seen:
+                continue
+            seen.add((src, dest))
+            edge_lines.append(f"{src}-{dest}:{float(dist):g}")
 
-    return {"nodes": nodes, "edges": edges}
+    return {"nodes": nodes, "edges": "\n".join(edge_lines)}
 
 
 if __name__ == "__main__":
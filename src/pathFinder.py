@@ -12,17 +12,44 @@ Expected plan format:
 """
 
 import networkx as nx
-import matplotlib.pyplot as plt
+from collections import OrderedDict
 from pathlib import Path
-from storeGraph import build_store_graph, find_shortest_path
+from storeGraph import get_cached_graph, compute_poi_apsp, graph_to_csr, hide_csr_nodes, DERIVED_GRAPH_KEYS
 
 #json_path = Path(__file__).resolve().parent.parent / "data" /"storeMap.json"
 
+# Avoid sets whose routing graphs are kept per store graph (least recently used dropped)
+ROUTING_CACHE_SIZE = 32
+
 # --------------------------------------------------
-def remove_avoids(G: nx.Graph, avoid_nodes):
-    """Remove nodes that the LLM instructed to avoid."""
-    if avoid_nodes:
-        G.remove_nodes_from(avoid_nodes)
+def get_routing_graph(avoid_nodes=None, json_path="data/storeMap.json"):
+    """
+    Return the cached store graph, or a read-only view hiding avoid_nodes.
+    Views are cached per avoid set, so the planner and executor share one
+    graph (and its memoized paths) across sessions.
+    """
+    G = get_cached_graph(json_path)
+    avoid = frozenset(n for n in avoid_nodes or () if n in G)
+    if not avoid:
+        return G
+
+    routing_graphs = G.graph.setdefault("routing_graphs", OrderedDict())
+    H = routing_graphs.get(avoid)
+    if H is None:
+        # Zero-copy: routing runs on the CSR matrix below, so the view is only
+        # used for membership checks and drawing
+        H = nx.restricted_view(G, avoid, [])
+        # Views share the base graph's attribute dict, whose memoized paths may
+        # cross avoided nodes; give the view its own dict without them
+        H.graph = {k: v for k, v in G.graph.items() if k not in DERIVED_GRAPH_KEYS}
+        # Cut the avoided nodes out of the base graph's matrix instead of rebuilding it
+        H.graph["csr"] = hide_csr_nodes(graph_to_csr(G), avoid)
+        routing_graphs[avoid] = H
+        if len(routing_graphs) > ROUTING_CACHE_SIZE:
+            routing_graphs.popitem(last=False)
+    else:
+        routing_graphs.move_to_end(avoid)
+    return H
 
 
 # --------------------------------------------------
@@ -37,6 +64,9 @@ def append_to_path(path_list, sub_path):
 # --------------------------------------------------
 def draw_path(G: nx.Graph, path):
     """Visualize the final route over the store map."""
+    # Imported here so plan execution never pays for matplotlib unless drawing
+    import matplotlib.pyplot as plt
+
     pos = {n: (G.nodes[n]["x"], G.nodes[n]["y"]) for n in G.nodes}
 
     nx.draw(G, pos, node_size=25, node_color="lightgray", edge_color="gainsboro")
@@ -55,10 +85,12 @@ def draw_path(G: nx.Graph, path):
 
 
 # --------------------------------------------------
-def execute_plan(plan: dict):
-    """Execute the route plan exactly as provided by the LLM."""
-    G = build_store_graph()
-    remove_avoids(G, plan.get("avoid", []))
+def execute_plan(plan: dict, *, visualize: bool = False, json_path="data/storeMap.json"):
+    """
+    Execute the route plan exactly as provided by the LLM.
+    Set visualize=True to draw the route (blocks on the plot window).
+    """
+    G = get_routing_graph(plan.get("avoid"), json_path)
     # Normalize plan keys and defaults
     start = plan.get("start")
     end = plan.get("end")
@@ -67,18 +99,25 @@ def execute_plan(plan: dict):
     if start is None or end is None:
         raise ValueError("Plan must include 'start' and 'end' nodes.")
 
-    waypoints = [start] + waypoints_list + [end]
+    # Visit each waypoint once; repeats (and stops at start/end) add nothing
+    waypoints_list = [w for w in dict.fromkeys(waypoints_list) if w not in (start, end)]
+    full = [start] + waypoints_list + [end]
+    # Collapse A→A legs, e.g. a plan that starts and ends at the same node
+    waypoints = [w for i, w in enumerate(full) if i == 0 or w != full[i - 1]]
 
-    path = []
+    path = [start] if len(waypoints) == 1 else []
     total_distance = 0.0
 
+    # One Dijkstra per distinct plan node; every leg is then a table lookup
+    apsp = compute_poi_apsp(G, waypoints)
+
     for a, b in zip(waypoints, waypoints[1:]):
-        # find_shortest_path returns (path, distance)
+        # apsp maps (source, target) → (path, distance)
         try:
-            sub_path, distance = find_shortest_path(G, a, b)
-        except Exception as e:
-            # Provide context if an inner lookup fails
-            raise ValueError(f"Error finding shortest path from {a} to {b}: {e}")
+            sub_path, distance = apsp[(a, b)]
+        except KeyError:
+            # Provide context if the target is unreachable from the source
+            raise ValueError(f"Error finding shortest path from {a} to {b}: no path between nodes.")
 
         append_to_path(path, sub_path)
         # accumulate the returned weighted distance
@@ -88,7 +127,8 @@ def execute_plan(plan: dict):
             # If distance isn't numeric for some reason, ignore but warn
             pass
 
-    draw_path(G, path)
+    if visualize:
+        draw_path(G, path)
     return path, total_distance
 
 
@@ -101,7 +141,7 @@ if __name__ == "__main__":
         "end": "REG",
         "avoid": ["E05", "E06"],
     }
-    result = execute_plan(sample_plan)
+    result = execute_plan(sample_plan, visualize=True)
     if isinstance(result, tuple) and len(result) == 2:
         full_path, total_dist = result
         print(f"Executed plan; total nodes in path: {len(full_path)}; total distance: {total_dist}")
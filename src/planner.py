@@ -0,0 +1,166 @@
+# planner.py
+# Orders the nodes a shopper needs to visit into a route plan.
+# Lists of up to EXACT_MAX_POIS stops are solved exactly (Held–Karp);
+# longer ones get a nearest-neighbor tour refined by 2-opt and or-opt,
+# which is near-optimal but carries no optimality guarantee.
+
+from storeGraph import compute_poi_apsp
+from pathFinder import get_routing_graph
+
+DEFAULT_START = "ENTRY1"
+DEFAULT_END = "REG"
+
+# Held–Karp is O(2^n · n^2): ~35 ms in pure Python at 12 stops, doubling per stop
+EXACT_MAX_POIS = 12
+
+
+# --------------------------------------------------
+def _held_karp(pois, start, end, d):
+    """Exact shortest start → all pois → end order by dynamic programming."""
+    n = len(pois)
+    inf = float("inf")
+    w = [[d(a, b) for b in pois] for a in pois]
+    full = (1 << n) - 1
+
+    # cost[mask][j]: shortest path from start through the set mask, ending at j
+    cost = [[inf] * n for _ in range(1 << n)]
+    parent = [[-1] * n for _ in range(1 << n)]
+    for j in range(n):
+        cost[1 << j][j] = d(start, pois[j])
+
+    for mask in range(1, full + 1):
+        row = cost[mask]
+        for j in range(n):
+            c = row[j]
+            if c == inf:
+                continue
+            for k in range(n):
+                bit = 1 << k
+                if mask & bit:
+                    continue
+                nc = c + w[j][k]
+                if nc < cost[mask | bit][k]:
+                    cost[mask | bit][k] = nc
+                    parent[mask | bit][k] = j
+
+    # --- Walk the parents back from the best final stop ---
+    j = min(range(n), key=lambda j: cost[full][j] + d(pois[j], end))
+    mask = full
+    order = []
+    while j != -1:
+        order.append(pois[j])
+        mask, j = mask ^ (1 << j), parent[mask][j]
+    order.reverse()
+    return order
+
+
+# --------------------------------------------------
+def _two_opt(route, d):
+    """Reverse interior segments while that shortens the route."""
+    # Store distances are symmetric, so only the two boundary hops change.
+    improved = False
+    for i in range(1, len(route) - 2):
+        for k in range(i + 1, len(route) - 1):
+            delta = (d(route[i - 1], route[k]) + d(route[i], route[k + 1])
+                     - d(route[i - 1], route[i]) - d(route[k], route[k + 1]))
+            if delta < -1e-9:
+                route[i:k + 1] = reversed(route[i:k + 1])
+                improved = True
+    return improved
+
+
+# --------------------------------------------------
+def _or_opt(route, d):
+    """Move runs of 1–3 interior stops (either way round) to a better spot."""
+    for seg_len in (1, 2, 3):
+        for i in range(1, len(route) - seg_len):
+            j = i + seg_len
+            segment = route[i:j]
+            saved = d(route[i - 1], segment[0]) + d(segment[-1], route[j]) - d(route[i - 1], route[j])
+            rest = route[:i] + route[j:]
+            for k in range(len(rest) - 1):
+                if k == i - 1:
+                    continue  # that's where the segment came from
+                a, b = rest[k], rest[k + 1]
+                for seg in (segment, segment[::-1]):
+                    if d(a, seg[0]) + d(seg[-1], b) - d(a, b) - saved < -1e-9:
+                        route[:] = rest[:k + 1] + seg + rest[k + 1:]
+                        return True
+    return False
+
+
+# --------------------------------------------------
+def solve_tsp(poi_nodes, start, end, dist_matrix):
+    """
+    Order poi_nodes for a path from start to end that visits each once.
+    dist_matrix maps (u, v) → shortest distance; missing pairs are unreachable.
+    Returns the ordered list of POIs (start and end excluded).
+    """
+    inf = float("inf")
+    d = lambda a, b: dist_matrix.get((a, b), inf)
+
+    pois = list(dict.fromkeys(n for n in poi_nodes if n not in (start, end)))
+    if len(pois) <= 1:
+        return pois
+    if len(pois) <= EXACT_MAX_POIS:
+        return _held_karp(pois, start, end, d)
+
+    # --- Nearest-neighbor construction ---
+    remaining = pois
+    route = [start]
+    while remaining:
+        nearest = min(remaining, key=lambda n: d(route[-1], n))
+        remaining.remove(nearest)
+        route.append(nearest)
+    route.append(end)
+
+    # --- Local search until neither move helps ---
+    while _two_opt(route, d) or _or_opt(route, d):
+        pass
+
+    return route[1:-1]
+
+
+# --------------------------------------------------
+def plan_route(poi_nodes, constraints=None, json_path="data/storeMap.json"):
+    """
+    Build a plan in the pathFinder format from the nodes to visit.
+    Honors the optional 'start', 'end' and 'avoid' keys of constraints.
+    """
+    constraints = constraints or {}
+    base = get_routing_graph(json_path=json_path)
+    start = constraints.get("start") if constraints.get("start") in base else DEFAULT_START
+    end = constraints.get("end") if constraints.get("end") in base else DEFAULT_END
+
+    # The route's own endpoints can never be avoided
+    avoid = [n for n in constraints.get("avoid") or [] if n not in (start, end)]
+    G = get_routing_graph(avoid, json_path)
+    # Nodes that don't exist (or were avoided) can't be visited
+    pois = [n for n in dict.fromkeys(poi_nodes) if n in G and n not in (start, end)]
+
+    nodes = [start] + pois + [end]
+    apsp = compute_poi_apsp(G, nodes)
+    if (start, end) not in apsp:
+        raise ValueError(f"No path from {start} to {end} that avoids {avoid}.")
+    # Store paths are undirected: a POI reachable from start reaches every other stop
+    pois = [n for n in pois if (start, n) in apsp]
+    nodes = [start] + pois + [end]
+    dist_matrix = {
+        (u, v): apsp[(u, v)][1]
+        for u in nodes for v in nodes
+        if u != v and (u, v) in apsp
+    }
+
+    return {
+        "start": start,
+        "waypoints": solve_tsp(pois, start, end, dist_matrix),
+        "end": end,
+        "avoid": avoid
+    }
+
+
+# --------------------------------------------------
+if __name__ == "__main__":
+    # example for quick testing
+    plan = plan_route(["E01", "G13", "G07", "BIKES"], {"avoid": ["E05", "E06"]})
+    print(plan)
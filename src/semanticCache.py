@@ -0,0 +1,126 @@
+# semanticCache.py
+# Response cache in front of the LLM calls.
+# Many sessions repeat the same shopping list in different words, so a hit
+# here skips both the parse and the planning step entirely.
+#   1. Exact tier: user text normalized to a sorted, de-duplicated item tuple
+#   2. Semantic tier: cosine similarity between user-text embeddings, served
+#      only when the cached entry covers the same items in other words
+# Entries are persisted with shelve and dropped when the store map changes.
+
+import re
+import shelve
+import numpy as np
+
+_ITEM_SPLIT = re.compile(r"[,;\n]|\band\b|&", re.IGNORECASE)
+_WORD = re.compile(r"[\w']+")
+# Words that don't change what is being asked for ('I need some milk' is 'milk')
+_FILLER = frozenset(
+    "i i'd i'm we we'd need needs want wants would like to get buy pick up grab "
+    "some a an the please also just do"
+    .split()
+)
+# Words that turn an item into something to leave out ('no milk', 'skip the milk')
+_NEGATIONS = frozenset("no not without skip avoid except don't dont never".split())
+
+
+class SemanticCache:
+    def __init__(self, get_client, cache_path, graph_key, threshold=0.92,
+                 embed_model="text-embedding-3-small"):
+        """
+        Load cached plans from cache_path. graph_key identifies the store
+        map version; entries saved for any other version are discarded.
+        get_client() returns the OpenAI client to embed with.
+        """
+        self.get_client = get_client
+        self.cache_path = str(cache_path)
+        self.graph_key = graph_key
+        self.threshold = threshold
+        self.embed_model = embed_model
+
+        with shelve.open(self.cache_path) as db:
+            if db.get("graph_key") == graph_key:
+                self.exact = db.get("exact", {})
+                self.entries = db.get("entries", [])
+                vectors = db.get("vectors")
+            else:
+                self.exact, self.entries, vectors = {}, [], None
+        # Unit-length rows, one per entry, so a dot product is the cosine similarity
+        if vectors is None or len(vectors) != len(self.entries):
+            self.entries, vectors = [], np.empty((0, 0), dtype=np.float32)
+        self.vectors = vectors
+
+    # --------------------------------------------------
+    @staticmethod
+    def normalize(user_text):
+        """'Milk, eggs and bread' → ('bread', 'eggs', 'milk')."""
+        items = {part.strip().casefold() for part in _ITEM_SPLIT.split(user_text)}
+        items.discard("")
+        return tuple(sorted(items))
+
+    # --------------------------------------------------
+    @staticmethod
+    def item_key(item):
+        """
+        'I need some milk' → (False, ('milk',)); 'skip the milk' → (True, ('milk',)).
+        Filler words are dropped and negation is kept apart from the words,
+        so only paraphrases of the same request share a key.
+        """
+        words = [w for w in _WORD.findall(item.casefold()) if w not in _FILLER]
+        negated = any(w in _NEGATIONS for w in words)
+        return negated, tuple(w for w in words if w not in _NEGATIONS)
+
+    # --------------------------------------------------
+    @classmethod
+    def same_items(cls, items, cached_items):
+        """
+        True when both sides ask for exactly the same items once filler
+        words are ignored ('I need milk' = 'I want milk'). Negated items and
+        constraint phrases ('no milk', 'avoid electronics') count too, so a
+        plan made for other items or constraints never matches.
+        """
+        return {cls.item_key(a) for a in items} == {cls.item_key(b) for b in cached_items}
+
+    # --------------------------------------------------
+    async def _embed(self, user_text):
+        """Embed user_text and scale it to unit length."""
+        response = await self.get_client().embeddings.create(model=self.embed_model, input=user_text)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    # --------------------------------------------------
+    def lookup_exact(self, user_text):
+        """Return the plan cached for exactly these items, or None."""
+        return self.exact.get(self.normalize(user_text))
+
+    # --------------------------------------------------
+    async def lookup_similar(self, user_text):
+        """
+        Return (plan, embedding) for the most similar cached request.
+        plan is None on a miss; the embedding is returned either way so
+        store() can reuse it.
+        """
+        embedding = await self._embed(user_text)
+        if self.entries:
+            similarities = self.vectors @ embedding
+            best = int(np.argmax(similarities))
+            entry = self.entries[best]
+            if similarities[best] >= self.threshold and self.same_items(self.normalize(user_text), entry["items"]):
+                return entry["plan"], embedding
+        return None, embedding
+
+    # --------------------------------------------------
+    async def store(self, user_text, plan, embedding=None):
+        """Cache plan under both tiers and persist the cache."""
+        if embedding is None:
+            embedding = await self._embed(user_text)
+
+        items = self.normalize(user_text)
+        self.exact[items] = plan
+        self.entries.append({"items": items, "plan": plan})
+        self.vectors = embedding[None, :] if not self.vectors.size else np.vstack([self.vectors, embedding])
+
+        with shelve.open(self.cache_path) as db:
+            db["graph_key"] = self.graph_key
+            db["exact"] = self.exact
+            db["entries"] = self.entries
+            db["vectors"] = self.vectors
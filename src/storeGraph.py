@@ -3,17 +3,32 @@
 # Each node = store section or aisle
 # Each edge = walkable path with distance weight
 
-import json
+import threading
 import networkx as nx
-import matplotlib.pyplot as plt
+import numpy as np
 from pathlib import Path
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import dijkstra
+from dataExtract import load_store_map
+
+try:
+    from numba import njit
+except ImportError:  # optional: SciPy's Dijkstra is used instead
+    njit = None
 
 #json_path = Path(__file__).resolve().parent.parent / "data" /"storeMap.json"
 
+# Built graphs keyed by (resolved json path, file mtime) so edits to the map
+# invalidate the entry on the next lookup.
+_GRAPH_CACHE: dict[tuple[str, float], nx.Graph] = {}
+
+# G.graph entries derived from the graph's topology; a graph with nodes
+# hidden or removed must not inherit them from its base graph.
+DERIVED_GRAPH_KEYS = ("csr", "sp_rows", "apsp", "routing_graphs")
+
 def build_store_graph(json_path = "data/storeMap.json"):
     """Load storeMap.json and build a weighted NetworkX graph."""
-    with open(json_path, "r") as f:
-        data = json.load(f)
+    data = load_store_map(json_path)
 
     nodes = data["nodes"]
     edges = data["edges"]
@@ -21,27 +36,57 @@ def build_store_graph(json_path = "data/storeMap.json"):
     G = nx.Graph()
 
     # --- Add Nodes ---
-    for node_id, props in nodes.items():
-        G.add_node(
-            node_id,
-            x=props["x"],
-            y=props["y"],
-            section=props.get("section", ""),
-            items=props.get("items", [])
-        )
+    G.add_nodes_from(
+        (node_id, {
+            "x": props["x"],
+            "y": props["y"],
+            "section": props.get("section", ""),
+            "items": props.get("items", [])
+        })
+        for node_id, props in nodes.items()
+    )
+
+    # Inverted index: normalized item name → [(node_id, section), ...]
+    item_index = {}
+    for node_id, attrs in G.nodes(data=True):
+        for item in attrs["items"]:
+            item_index.setdefault(item.strip().casefold(), []).append((node_id, attrs["section"]))
+    G.graph["item_index"] = item_index
 
     # --- Add Edges ---
-    for src, neighbors in edges.items():
-        for dest, dist in neighbors.items():
-            # Avoid duplicate edges (NetworkX handles fine, but this ensures clarity)
-            if not G.has_edge(src, dest):
-                G.add_edge(src, dest, weight=float(dist))
+    # Edges listed in both directions collapse to one; add_edge just re-sets the weight
+    G.add_edges_from(
+        (src, dest, {"weight": float(dist)})
+        for src, neighbors in edges.items()
+        for dest, dist in neighbors.items()
+    )
+
+    return G
+
 
+def get_cached_graph(json_path = "data/storeMap.json"):
+    """
+    Return the store graph for json_path, building it only when the file
+    is new or has changed since the last call.
+    The returned graph is shared — copy it before mutating.
+    """
+    path = Path(json_path).resolve()
+    key = (str(path), path.stat().st_mtime)
+    G = _GRAPH_CACHE.get(key)
+    if G is None:
+        # Drop stale entries for the same file before caching the rebuild
+        for stale in [k for k in _GRAPH_CACHE if k[0] == key[0]]:
+            del _GRAPH_CACHE[stale]
+        G = build_store_graph(path)
+        G.graph["source"] = key  # which version of the map this graph reflects
+        _GRAPH_CACHE[key] = G
     return G
 
 
 def plot_store_graph(G):
     """Visualize the store layout using node coordinates."""
+    import matplotlib.pyplot as plt
+
     pos = {n: (G.nodes[n]["x"], G.nodes[n]["y"]) for n in G.nodes}
     plt.figure(figsize=(7, 5))
     nx.draw(
@@ -57,12 +102,21 @@ def plot_store_graph(G):
 
 
 def find_section_by_item(G, item_name: str):
-    """Find the node(s) that contain a specific item."""
-    item_name = item_name.lower()
+    """
+    Find the node(s) that contain a specific item.
+    Exact names are served from the graph's item index; anything else
+    falls back to a substring scan over every node.
+    """
+    item_name = item_name.strip().casefold()
+    exact = G.graph.get("item_index", {}).get(item_name)
+    if exact:
+        # Skip nodes hidden by a view of the indexed graph
+        return [(node, section) for node, section in exact if node in G]
+
     matches = []
     for node, attrs in G.nodes(data=True):
         for item in attrs.get("items", []):
-            if item_name in item.lower():
+            if item_name in item.casefold():
                 matches.append((node, attrs["section"]))
     return matches
 
@@ -71,9 +125,182 @@ def find_shortest_path(G, start_node: str, end_node: str):
     """Return the shortest path and total distance between two nodes."""
     if start_node not in G or end_node not in G:
         raise ValueError("Invalid node(s) provided.")
-    path = nx.shortest_path(G, source=start_node, target=end_node, weight="weight")
-    distance = nx.shortest_path_length(G, source=start_node, target=end_node, weight="weight")
-    return path, distance   #Testing update, for functionality in pathfinder, remove distance - will address later
+    # Point-to-point query: searching from both ends settles far fewer nodes
+    # than a single-source Dijkstra on the long, aisle-shaped store layout
+    distance, path = nx.bidirectional_dijkstra(G, start_node, end_node, weight="weight")
+    return path, distance
+
+
+def graph_to_csr(G):
+    """
+    Return (csr_matrix, node_to_idx, idx_to_node) for G, memoized on
+    G.graph["csr"].
+    """
+    if "csr" not in G.graph:
+        idx_to_node = list(G)
+        node_to_idx = {node: i for i, node in enumerate(idx_to_node)}
+        csr = nx.to_scipy_sparse_array(G, nodelist=idx_to_node, weight="weight", format="csr")
+        G.graph["csr"] = (csr, node_to_idx, idx_to_node)
+    return G.graph["csr"]
+
+
+def hide_csr_nodes(csr_graph, hidden_nodes):
+    """
+    Derive a graph_to_csr triple with hidden_nodes cut off from a base
+    graph's triple, without rebuilding from NetworkX. Their matrix entries
+    are dropped but the node ↔ index lookups are kept, so the hidden
+    nodes simply become unreachable.
+    """
+    csr, node_to_idx, idx_to_node = csr_graph
+    keep = np.ones(csr.shape[0], dtype=bool)
+    keep[[node_to_idx[n] for n in hidden_nodes]] = False
+
+    rows = np.repeat(np.arange(csr.shape[0]), np.diff(csr.indptr))
+    kept = keep[rows] & keep[csr.indices]
+    restricted = csr_array(
+        (csr.data[kept], (rows[kept], csr.indices[kept])),
+        shape=csr.shape
+    )
+    return restricted, node_to_idx, idx_to_node
+
+
+def _dijkstra_csr(indptr, indices, weights, src):
+    """
+    Single-source Dijkstra over raw CSR arrays with an array-backed binary
+    heap (lazy deletion). Returns (dist, pred) rows in SciPy's format:
+    inf for unreachable nodes and -9999 where there is no predecessor.
+    JIT-compiled with Numba when it is installed.
+    """
+    n = indptr.shape[0] - 1
+    dist = np.full(n, np.inf)
+    pred = np.full(n, -9999, dtype=np.int64)
+    done = np.zeros(n, dtype=np.bool_)
+    # Every push follows an edge relaxation, so nnz + 1 slots always suffice
+    heap_d = np.empty(indices.shape[0] + 1)
+    heap_v = np.empty(indices.shape[0] + 1, dtype=np.int64)
+
+    dist[src] = 0.0
+    heap_d[0] = 0.0
+    heap_v[0] = src
+    size = 1
+    while size > 0:
+        # --- Pop the minimum, then sift the last entry down from the root ---
+        d = heap_d[0]
+        u = heap_v[0]
+        size -= 1
+        if size > 0:
+            last_d = heap_d[size]
+            last_v = heap_v[size]
+            i = 0
+            while True:
+                child = 2 * i + 1
+                if child >= size:
+                    break
+                if child + 1 < size and heap_d[child + 1] < heap_d[child]:
+                    child += 1
+                if heap_d[child] >= last_d:
+                    break
+                heap_d[i] = heap_d[child]
+                heap_v[i] = heap_v[child]
+                i = child
+            heap_d[i] = last_d
+            heap_v[i] = last_v
+
+        if done[u]:
+            continue  # stale entry for an already-settled node
+        done[u] = True
+
+        # --- Relax neighbors, pushing improved entries and sifting them up ---
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            nd = d + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                pred[v] = u
+                i = size
+                size += 1
+                while i > 0:
+                    parent = (i - 1) // 2
+                    if heap_d[parent] <= nd:
+                        break
+                    heap_d[i] = heap_d[parent]
+                    heap_v[i] = heap_v[parent]
+                    i = parent
+                heap_d[i] = nd
+                heap_v[i] = v
+    return dist, pred
+
+
+# Set once the Numba kernel is compiled; until then SciPy's Dijkstra is used
+_KERNEL_READY = threading.Event()
+
+
+def _compile_kernel():
+    """Compile _dijkstra_csr on a one-node graph, off the request path."""
+    _dijkstra_csr(np.zeros(2, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), 0)
+    _KERNEL_READY.set()
+
+
+if njit is not None:
+    _dijkstra_csr = njit(cache=True)(_dijkstra_csr)
+    # A cold compile takes about a second; don't make the first plan wait for it
+    threading.Thread(target=_compile_kernel, name="dijkstra-jit", daemon=True).start()
+
+
+def _reconstruct_path(predecessors, source_idx, target_idx):
+    """Walk a SciPy predecessor row back from target to source."""
+    path = [target_idx]
+    while path[-1] != source_idx:
+        path.append(predecessors[path[-1]])
+    path.reverse()
+    return path
+
+
+def compute_poi_apsp(G, poi_nodes):
+    """
+    Shortest paths between points of interest (the nodes a plan visits).
+    New POIs are expanded over the CSR matrix, by the Numba kernel once it
+    has compiled and otherwise in one SciPy Dijkstra call;
+    the distance/predecessor rows are kept in G.graph["sp_rows"] and the
+    POI pairs memoized on G.graph["apsp"] as {(source, target): (path, distance)},
+    so repeated plans over the same graph only pay for new POIs.
+    """
+    missing = [n for n in poi_nodes if n not in G]
+    if missing:
+        raise ValueError(f"Invalid node(s) provided: {missing}")
+
+    csr, node_to_idx, idx_to_node = graph_to_csr(G)
+    rows = G.graph.setdefault("sp_rows", {})
+    pois = list(dict.fromkeys(poi_nodes))
+
+    # --- Expand every POI not seen before ---
+    new_sources = [n for n in pois if n not in rows]
+    if new_sources and _KERNEL_READY.is_set():
+        indptr = csr.indptr.astype(np.int64)
+        indices = csr.indices.astype(np.int64)
+        weights = csr.data.astype(np.float64)
+        for source in new_sources:
+            rows[source] = _dijkstra_csr(indptr, indices, weights, node_to_idx[source])
+    elif new_sources:
+        distances, predecessors = dijkstra(
+            csr, directed=False,
+            indices=[node_to_idx[n] for n in new_sources],
+            return_predecessors=True
+        )
+        for source, dist_row, pred_row in zip(new_sources, distances, predecessors):
+            rows[source] = (dist_row, pred_row)
+
+    # --- Materialize the POI-to-POI paths ---
+    apsp = G.graph.setdefault("apsp", {})
+    for source in pois:
+        dist_row, pred_row = rows[source]
+        for target in pois:
+            target_idx = node_to_idx[target]
+            if (source, target) in apsp or not np.isfinite(dist_row[target_idx]):
+                continue  # known, or unreachable
+            path = _reconstruct_path(pred_row, node_to_idx[source], target_idx)
+            apsp[(source, target)] = ([idx_to_node[i] for i in path], float(dist_row[target_idx]))
+    return apsp
 
 
 